@@ -0,0 +1,23 @@
+import os
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException, status
+
+# --- Admin Access ---
+# /api/admin/* endpoints (admission stats, search cache stats, request profiles) require the
+# X-Admin-Token header to match the ADMIN_TOKEN env var. Without ADMIN_TOKEN they are disabled.
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def token_matches(raw_value: Optional[bytes]) -> bool:
+    """Constant-time check of a raw X-Admin-Token header value against ADMIN_TOKEN."""
+    if not ADMIN_TOKEN or raw_value is None:
+        return False
+    return hmac.compare_digest(raw_value, ADMIN_TOKEN.encode("utf-8"))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency guarding admin endpoints with the ADMIN_TOKEN env var."""
+    # Starlette decodes headers as latin-1; encoding back gives the raw bytes that were sent
+    raw_value = x_admin_token.encode("latin-1") if x_admin_token is not None else None
+    if not token_matches(raw_value):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
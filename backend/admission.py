@@ -0,0 +1,146 @@
+import os
+import asyncio
+import time
+from collections import deque
+from fastapi import HTTPException, status
+
+# --- Admission Control / Load Shedding ---
+# Each expensive endpoint belongs to a cost class. A class admits at most `concurrency`
+# requests at once and lets at most `queue` more wait (for up to `queue_timeout` seconds).
+# Anything beyond that is rejected immediately with 503 + Retry-After, so a burst of exports
+# or full-table searches can't tie up every threadpool worker and DB connection and stall
+# cheap point reads.
+#
+# Limits are per worker process and can be overridden with environment variables, e.g.
+# ADMISSION_EXPORT_CONCURRENCY=2, ADMISSION_EXPORT_QUEUE=4, ADMISSION_EXPORT_QUEUE_TIMEOUT=10
+
+# cost class -> (concurrency, queue, queue_timeout seconds, Retry-After seconds)
+DEFAULT_LIMITS = {
+    "export": (2, 4, 10.0, 10),
+    "import": (1, 2, 10.0, 10),
+    "search": (8, 16, 2.0, 2),
+    "point_read": (32, 128, 1.0, 1),
+}
+
+def _env_number(name: str, default, cast):
+    value = os.getenv(name)
+    return cast(value) if value else default
+
+class AdmissionLimiter:
+    """Concurrency + queue-depth limiter for one cost class (asyncio, FIFO)."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = deque() # futures of queued requests, created on the running loop
+        # Stats
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _shed(self):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server busy ({self.name}), please retry later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def acquire(self):
+        """Admit the request, queue it, or raise 503 if the queue is full or the wait times out."""
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            self._shed()
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            # If the slot was handed over just as we timed out, keep it rather than leak it
+            if not waiter.done():
+                waiter.cancel()
+                self.shed_timeout += 1
+                self._shed()
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot we may already have been given
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+        waited = time.monotonic() - started
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.admitted += 1
+
+    def release(self):
+        """Hand the slot to the next queued request, or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None) # `active` stays the same: slot moves to the waiter
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_limit": self.max_queue,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_queue_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_queue_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+def _build_limiters() -> dict:
+    limiters = {}
+    for name, (concurrency, queue, queue_timeout, retry_after) in DEFAULT_LIMITS.items():
+        prefix = f"ADMISSION_{name.upper()}_"
+        limiters[name] = AdmissionLimiter(
+            name,
+            concurrency=_env_number(prefix + "CONCURRENCY", concurrency, int),
+            queue=_env_number(prefix + "QUEUE", queue, int),
+            queue_timeout=_env_number(prefix + "QUEUE_TIMEOUT", queue_timeout, float),
+            retry_after=retry_after,
+        )
+    return limiters
+
+limiters = _build_limiters()
+
+def limit(cost_class: str):
+    """
+    Dependency factory: admit the request under `cost_class` for the duration of the request.
+    Add it to the route's `dependencies=[...]` so it runs before the DB session is opened.
+    """
+    limiter = limiters[cost_class]
+
+    async def admission_dependency():
+        await limiter.acquire()
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    return admission_dependency
+
+def get_stats() -> dict:
+    """Per cost class admission stats (this worker process only)."""
+    return {name: limiter.stats() for name, limiter in limiters.items()}
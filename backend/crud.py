@@ -1,8 +1,29 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import or_, and_, func
 import models, schemas # Changed from relative import
+from search_cache import search_cache, normalize_query
 from typing import List, Optional
 
+# --- Change Versions ---
+
+USERS_VERSION_NAME = "users" # Covers users, secondary_emails and educations (all affect search results)
+
+def get_users_version(db: Session) -> int:
+    """Current change version of the user tables (used to invalidate the search cache)."""
+    version = db.query(models.TableVersion.version).filter(models.TableVersion.name == USERS_VERSION_NAME).scalar()
+    return version or 0
+
+def bump_users_version(db: Session):
+    """
+    Bumps the user tables' change version.
+    Call before db.commit() so the bump is committed in the same transaction as the write.
+    """
+    updated = db.query(models.TableVersion).filter(models.TableVersion.name == USERS_VERSION_NAME).update(
+        {models.TableVersion.version: models.TableVersion.version + 1}, synchronize_session=False
+    )
+    if not updated: # Row is normally seeded at startup; create it if missing
+        db.add(models.TableVersion(name=USERS_VERSION_NAME, version=1))
+
 # --- User CRUD ---
 
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
@@ -17,6 +38,13 @@ def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]
     """Gets a list of users with pagination."""
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def get_users_by_ids(db: Session, user_ids: List[int]) -> List[models.User]:
+    """Gets users by ID, returned in the order of `user_ids` (missing IDs are skipped)."""
+    if not user_ids:
+        return []
+    users_by_id = {user.id: user for user in db.query(models.User).filter(models.User.id.in_(user_ids)).all()}
+    return [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id]
+
 def get_all_users(db: Session) -> List[models.User]:
     """Gets all users without pagination."""
     return db.query(models.User).all()
@@ -35,6 +63,7 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
         remark3=user.remark3
     )
     db.add(db_user)
+    bump_users_version(db)
     db.commit()
     db.refresh(db_user) # Refresh to get the generated ID
 
@@ -85,6 +114,7 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate) -> O
             db.add(db_education)
 
     db.add(db_user) # Add the user instance itself (updates core fields)
+    bump_users_version(db)
     try:
         db.commit()
         db.refresh(db_user)
@@ -96,10 +126,12 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate) -> O
     return db_user
 
 def delete_user(db: Session, user_id: int) -> Optional[models.User]:
-    """Deletes a user by their ID."""
+    """Deletes a user by their ID (and removes them from any duplicate clusters)."""
     db_user = get_user(db, user_id)
     if db_user:
+        remove_user_from_duplicate_clusters(db, user_id)
         db.delete(db_user)
+        bump_users_version(db)
         db.commit()
     return db_user
 
@@ -109,6 +141,7 @@ def create_secondary_email(db: Session, secondary_email: schemas.SecondaryEmailC
     """Creates a secondary email associated with a user."""
     db_secondary_email = models.SecondaryEmail(**secondary_email.model_dump(), user_id=user_id)
     db.add(db_secondary_email)
+    bump_users_version(db)
     db.commit()
     db.refresh(db_secondary_email)
     return db_secondary_email
@@ -118,6 +151,7 @@ def delete_secondary_email(db: Session, email_id: int) -> Optional[models.Second
     db_email = db.query(models.SecondaryEmail).filter(models.SecondaryEmail.id == email_id).first()
     if db_email:
         db.delete(db_email)
+        bump_users_version(db)
         db.commit()
     return db_email
 
@@ -127,6 +161,7 @@ def create_education(db: Session, education: schemas.EducationCreate, user_id: i
     """Creates an education record associated with a user."""
     db_education = models.Education(**education.model_dump(), user_id=user_id)
     db.add(db_education)
+    bump_users_version(db)
     db.commit()
     db.refresh(db_education)
     return db_education
@@ -140,15 +175,75 @@ def delete_education(db: Session, education_id: int) -> Optional[models.Educatio
     db_education = db.query(models.Education).filter(models.Education.id == education_id).first()
     if db_education:
         db.delete(db_education)
+        bump_users_version(db)
         db.commit()
     return db_education
 
 # Optional: Add update_education function if needed
 
+# --- Duplicate Clusters (written by dedup.py) ---
+
+def get_duplicate_clusters(db: Session, status: Optional[str] = "pending", skip: int = 0, limit: int = 100) -> List[models.DuplicateCluster]:
+    """Gets duplicate clusters, highest score first, optionally filtered by review status."""
+    db_query = db.query(models.DuplicateCluster).options(selectinload(models.DuplicateCluster.members)) # One query for all members
+    if status:
+        db_query = db_query.filter(models.DuplicateCluster.status == status)
+    return db_query.order_by(models.DuplicateCluster.max_score.desc(), models.DuplicateCluster.id).offset(skip).limit(limit).all()
+
+def update_duplicate_cluster_status(db: Session, cluster_id: int, status: str) -> Optional[models.DuplicateCluster]:
+    """Sets a duplicate cluster's review status ('pending', 'confirmed' or 'rejected')."""
+    db_cluster = db.query(models.DuplicateCluster).filter(models.DuplicateCluster.id == cluster_id).first()
+    if db_cluster:
+        db_cluster.status = status
+        db.commit()
+        db.refresh(db_cluster)
+    return db_cluster
+
+def remove_user_from_duplicate_clusters(db: Session, user_id: int):
+    """
+    Removes a user's duplicate_cluster_members rows (they reference users.id) and drops clusters
+    left with fewer than 2 members. Doesn't commit: called as part of delete_user.
+    """
+    cluster_ids = [
+        cluster_id for (cluster_id,) in
+        db.query(models.DuplicateClusterMember.cluster_id).filter(models.DuplicateClusterMember.user_id == user_id).distinct()
+    ]
+    if not cluster_ids:
+        return
+    # Bulk deletes only: clusters are never loaded, so their members cascade can't delete the same rows again
+    db.query(models.DuplicateClusterMember).filter(models.DuplicateClusterMember.user_id == user_id).delete(synchronize_session=False)
+    remaining = dict(
+        db.query(models.DuplicateClusterMember.cluster_id, func.count(models.DuplicateClusterMember.id))
+        .filter(models.DuplicateClusterMember.cluster_id.in_(cluster_ids))
+        .group_by(models.DuplicateClusterMember.cluster_id)
+    )
+    dropped = [cluster_id for cluster_id in cluster_ids if remaining.get(cluster_id, 0) < 2]
+    if dropped:
+        db.query(models.DuplicateClusterMember).filter(models.DuplicateClusterMember.cluster_id.in_(dropped)).delete(synchronize_session=False)
+        db.query(models.DuplicateCluster).filter(models.DuplicateCluster.id.in_(dropped)).delete(synchronize_session=False)
+    for cluster_id, size in remaining.items():
+        if size >= 2:
+            db.query(models.DuplicateCluster).filter(models.DuplicateCluster.id == cluster_id).update({"size": size}, synchronize_session=False)
+
 # --- Search Functionality ---
 
 def search_users(db: Session, query: schemas.UserSearchQuery, skip: int = 0, limit: int = 100) -> List[models.User]:
-    """Searches for users based on multiple optional criteria, including education details."""
+    """
+    Searches for users based on multiple optional criteria, including education details.
+    Result ids are cached per normalized query + pagination and invalidated by the users change version.
+    """
+    cache_key = (normalize_query(query), skip, limit)
+    version = get_users_version(db) # Read before searching, so a concurrent write can only make the entry stale
+    cached_ids = search_cache.get(cache_key, version)
+    if cached_ids is not None:
+        return get_users_by_ids(db, cached_ids)
+
+    users = _search_users_uncached(db, query, skip=skip, limit=limit)
+    search_cache.put(cache_key, version, [user.id for user in users])
+    return users
+
+def _search_users_uncached(db: Session, query: schemas.UserSearchQuery, skip: int = 0, limit: int = 100) -> List[models.User]:
+    """Runs the search query against the database (see search_users)."""
     db_query = db.query(models.User).distinct() # Use distinct to avoid duplicates when joining
     user_filters = []
     education_filters = []
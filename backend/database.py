@@ -1,9 +1,16 @@
 import os
-from sqlalchemy import create_engine
+import hmac
+import math
+import hashlib
+import threading
+import time
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession # Import async engine creator
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from databases import Database # Keep for existing async query patterns if any, or remove if fully switching to SQLAlchemy async
+from sqlalchemy.orm import Session, sessionmaker
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./user_info.db") # Default to aiosqlite scheme
 
@@ -12,53 +19,270 @@ connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False} # Needed only for SQLite
 
+# Optional read replicas (comma-separated list of URLs, same scheme rules as DATABASE_URL)
+# Leave unset to send all traffic to the primary.
+REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()
+]
+# After a client writes, its reads stay on the primary for this many seconds (read-your-writes)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Signs the read-your-writes tokens (see make_last_write_token) so clients can't forge them
+LAST_WRITE_SECRET = os.getenv("SECRET_KEY", "").encode("utf-8")
+# How long a failed replica is skipped before it is probed again
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+def to_sync_url(url: str) -> str:
+    """Sync engines need the non-async dialect of a URL."""
+    return url.replace("+asyncpg", "").replace("+aiosqlite", "")
+
+def connect_args_for(url: str) -> dict:
+    """connect_args for a given URL (SQLite needs check_same_thread disabled)."""
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
 # SQLAlchemy setup
-# Synchronous engine (potentially for Alembic or specific sync tasks)
-# Note: SessionLocal created here is SYNC, suitable for FastAPI Depends
-engine = create_engine(
-    DATABASE_URL.replace("+asyncpg", "").replace("+aiosqlite", ""), # Sync engine needs non-async dialect
-    connect_args=connect_args
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) # Sync Session
+# Engines are created lazily on first use, not at import time: a launcher process (serve.py)
+# can import this module and bootstrap the schema without handing open pooled connections
+# to the worker processes, and each worker builds its own engine only when it needs one.
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """The synchronous engine for the primary database, created on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    to_sync_url(DATABASE_URL), # Sync engine needs non-async dialect
+                    connect_args=connect_args
+                )
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+def dispose_engines():
+    """Closes all pooled connections and forgets the engines (e.g. before forking workers)."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+            SessionLocal.configure(bind=None)
+    session_router.dispose()
+
+class LazySessionMaker(sessionmaker):
+    """sessionmaker that creates the primary engine on the first session."""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            get_engine() # Binds this sessionmaker
+        return super().__call__(**local_kw)
+
+# Note: SessionLocal is SYNC, suitable for FastAPI Depends
+SessionLocal = LazySessionMaker(autocommit=False, autoflush=False) # Sync Session
 Base = declarative_base()
 
-# Asynchronous engine (for async operations like table creation)
-async_engine = create_async_engine(DATABASE_URL)
+# --- Read Replica Routing ---
+
+class SessionRouter:
+    """
+    Routes sessions between the primary and the optional read replicas.
+    Writes always go to the primary. Reads go to a healthy replica (round-robin),
+    except for clients that wrote recently (see get_read_db), which stay on the
+    primary so they see their own changes despite replication lag.
+    """
+
+    def __init__(self, replica_urls, retry_seconds: float):
+        self.replica_urls = list(replica_urls)
+        self._replicas = None # sessionmakers, created on first use (see get_engine)
+        self.retry_seconds = retry_seconds
+        self._down_until = [0.0] * len(self.replica_urls) # monotonic time until which a replica is skipped
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def replicas(self) -> list:
+        if self._replicas is None:
+            with self._lock:
+                if self._replicas is None:
+                    self._replicas = [
+                        sessionmaker(
+                            autocommit=False,
+                            autoflush=False,
+                            bind=create_engine(to_sync_url(url), connect_args=connect_args_for(url), pool_pre_ping=True),
+                        )
+                        for url in self.replica_urls
+                    ]
+        return self._replicas
+
+    def dispose(self):
+        """Closes the replica engines' pooled connections and forgets them."""
+        with self._lock:
+            replicas, self._replicas = self._replicas, None
+        for replica in replicas or []:
+            replica.kw["bind"].dispose()
+
+    def mark_down(self, index: int):
+        """Skip a replica until REPLICA_RETRY_SECONDS have passed."""
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_seconds
+
+    def _candidates(self):
+        """Replica indexes to try, in round-robin order, skipping ones marked down."""
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.replica_urls), 1)
+            down_until = list(self._down_until)
+        order = [(start + i) % len(self.replica_urls) for i in range(len(self.replica_urls))]
+        return [i for i in order if down_until[i] <= now]
+
+    def read_session(self, use_primary: bool = False) -> Session:
+        """Open a session for a read-only request, failing over to the primary."""
+        if not self.replica_urls or use_primary:
+            return SessionLocal()
+        for index in self._candidates():
+            db = self.replicas[index]()
+            try:
+                # Check out the connection now so a dead replica fails here (via pool_pre_ping)
+                # rather than in the middle of the handler; no extra query is sent
+                db.connection()
+                return db
+            except DBAPIError as e:
+                db.close()
+                print(f"Read replica #{index} unavailable, failing over: {e}") # Basic error logging
+                self.mark_down(index)
+        return SessionLocal()
+
+    def status(self) -> list:
+        """Per-replica health, for diagnostics."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {"replica": i, "healthy": down_until <= now}
+                for i, down_until in enumerate(self._down_until)
+            ]
+
+session_router = SessionRouter(REPLICA_DATABASE_URLS, REPLICA_RETRY_SECONDS)
+
+# --- Read-your-writes ---
+# Stickiness is carried by the client rather than kept in each worker's memory (workers don't
+# share it, and behind a proxy such as the Next.js route handlers every user has the same IP).
+# Responses to requests that used get_db carry a `last_write` token, as a cookie and as the
+# X-Last-Write header: the time the response was sent, signed with SECRET_KEY. Reads that
+# present a token younger than READ_YOUR_WRITES_SECONDS (header first, else cookie) are served
+# by the primary, whichever worker handles them.
 
-# Databases library setup (for async)
-# Ensure the URL scheme is compatible with 'databases' library
-# For SQLite, it expects 'sqlite+aiosqlite://...'
-# For PostgreSQL, it expects 'postgresql+asyncpg://...'
-# The getenv default above already sets the SQLite scheme correctly.
-# Users need to ensure their POSTGRESQL_DATABASE_URL uses the 'postgresql+asyncpg://' scheme.
-database = Database(DATABASE_URL, force_rollback=False) # Set force_rollback=True for testing if needed
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "x-last-write"
+LAST_WRITE_MAX_CLOCK_SKEW = 1.0 # Seconds a token may be "from the future" (clocks of different hosts)
 
-def get_db():
-    """Dependency to get a SQLAlchemy session."""
+def _sign_last_write(timestamp: str) -> str:
+    return hmac.new(LAST_WRITE_SECRET, timestamp.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def make_last_write_token(written_at: Optional[float] = None) -> str:
+    """Signed '<unix time>.<signature>' token marking a write at `written_at` (default: now)."""
+    timestamp = f"{time.time() if written_at is None else written_at:.3f}"
+    return f"{timestamp}.{_sign_last_write(timestamp)}"
+
+def wrote_recently(token: Optional[str]) -> bool:
+    """True if `token` is a valid last_write token younger than READ_YOUR_WRITES_SECONDS."""
+    if not token:
+        return False
+    timestamp, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(signature.encode("utf-8"), _sign_last_write(timestamp).encode("utf-8")):
+        return False
+    try:
+        age = time.time() - float(timestamp)
+    except ValueError:
+        return False
+    return -LAST_WRITE_MAX_CLOCK_SKEW <= age < READ_YOUR_WRITES_SECONDS
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware adding the last_write token to responses of requests that used get_db.
+    Issued when the response starts, i.e. after the handler committed, so the window covers
+    writes of any duration. Does nothing without read replicas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not session_router.replica_urls:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and scope.get("state", {}).get("used_primary"):
+                token = make_last_write_token()
+                cookie = (
+                    f"{LAST_WRITE_COOKIE}={token}; Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((LAST_WRITE_HEADER.encode("latin-1"), token.encode("latin-1")))
+                headers.append((b"set-cookie", cookie.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+def get_db(request: Request):
+    """
+    Dependency to get a SQLAlchemy session on the primary (use for writes).
+    The response gets a last_write token, keeping the client's next reads on the primary.
+    """
+    request.state.used_primary = True # Read by ReadYourWritesMiddleware
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-async def connect_db():
-    """Connect the 'databases' library."""
-    await database.connect()
+def get_read_db(request: Request):
+    """Dependency to get a SQLAlchemy session for read-only endpoints (replica when available)."""
+    token = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    db = session_router.read_session(use_primary=wrote_recently(token))
+    try:
+        yield db
+    finally:
+        db.close()
 
-async def disconnect_db():
-    """Disconnect the 'databases' library."""
-    await database.disconnect()
+def check_db() -> bool:
+    """Readiness check: can the primary database run a trivial query?"""
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except DBAPIError as e:
+        print(f"Database readiness check failed: {e}") # Basic error logging
+        return False
+
+def _seed_table_versions(sync_conn):
+    """Ensures the change-version rows exist (see models.TableVersion / crud.bump_users_version)."""
+    table = Base.metadata.tables.get("table_versions")
+    if table is None:
+        return
+    if sync_conn.execute(select(table.c.name).where(table.c.name == "users")).first() is None:
+        sync_conn.execute(table.insert().values(name="users", version=0))
 
-# def create_db_and_tables(): # Keep original sync version commented out or remove
-#     """Synchronous table creation (DO NOT USE WITH ASYNC ENGINE STARTUP)."""
-#     print("Running SYNC create_db_and_tables (likely incorrect for async setup)")
-#     Base.metadata.create_all(bind=engine) # Uses the sync engine
+def bootstrap_schema():
+    """
+    Synchronous table creation + seeding, for launchers running outside an event loop
+    (serve.py runs this once before starting the workers). Don't call from async startup.
+    """
+    with get_engine().begin() as conn:
+        Base.metadata.create_all(bind=conn, checkfirst=True)
+        _seed_table_versions(conn)
 
 async def async_create_db_and_tables():
-    """Creates database tables asynchronously using the async engine."""
-    async with async_engine.begin() as conn:
-        # Use run_sync to execute the synchronous metadata.create_all within the async context
-        # Use checkfirst=True to avoid errors if tables already exist
-        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
-    # Optional: Dispose the engine if it's only used for startup
-    # await async_engine.dispose()
\ No newline at end of file
+    """Creates database tables asynchronously using a short-lived async engine."""
+    # Asynchronous engine (only used for table creation, so it's disposed right after)
+    async_engine = create_async_engine(DATABASE_URL)
+    try:
+        async with async_engine.begin() as conn:
+            # Use run_sync to execute the synchronous metadata.create_all within the async context
+            # Use checkfirst=True to avoid errors if tables already exist
+            await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+            await conn.run_sync(_seed_table_versions)
+    finally:
+        await async_engine.dispose()
@@ -0,0 +1,383 @@
+"""
+Batch duplicate-person detection.
+
+Finds users that are probably the same person entered twice (e.g. via create_user and
+import_users_from_csv under different primary emails) and writes reviewable match clusters
+to the duplicate_clusters / duplicate_cluster_members tables.
+
+To avoid comparing every pair of users (O(n^2)), users are grouped by blocking keys and only
+pairs sharing a block are scored:
+  * normalized full name + birth year
+  * email local part (primary and secondary emails, '+tag' stripped)
+  * exact email (e.g. one user's secondary email is another user's primary email)
+Blocks larger than --max-block-size (e.g. 'info@...') are skipped as uninformative.
+Candidate pairs are scored in vectorized numpy batches across a process pool, matched pairs
+are merged into clusters (connected components), and the clusters replace the previous run's
+still-pending clusters (reviewed clusters are kept).
+
+Usage (from the backend directory):
+    python dedup.py [--threshold 0.75] [--workers N] [--max-block-size 100] [--dry-run]
+"""
+import os
+import time
+import uuid
+import argparse
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, insert
+
+load_dotenv() # Before importing database so DATABASE_URL from .env is used
+
+import models # noqa: E402
+from database import get_engine, bootstrap_schema, SessionLocal # noqa: E402
+
+# Score weights (summed, capped at 1.0). Same name + same birth date alone reaches the default threshold.
+WEIGHT_SAME_NAME = 0.45
+WEIGHT_SAME_BIRTH_DATE = 0.35
+WEIGHT_SAME_BIRTH_YEAR = 0.05 # Only when the full birth date differs
+WEIGHT_SHARED_EMAIL_LOCAL = 0.15
+WEIGHT_SHARED_EMAIL = 0.40
+
+DEFAULT_THRESHOLD = 0.75
+DEFAULT_MAX_BLOCK_SIZE = 100
+BATCH_SIZE = 1_000_000 # Candidate pairs per scoring batch
+LOAD_CHUNK_SIZE = 50_000
+INSERT_CHUNK_SIZE = 10_000
+
+# --- Normalization ---
+
+def normalize_name(name) -> str:
+    """Lower-case, accent-free, punctuation-free name with sorted tokens ('Smith, John' == 'john smith')."""
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(" " if not ch.isalnum() else ch for ch in name if not unicodedata.combining(ch))
+    return " ".join(sorted(name.lower().split()))
+
+def normalize_email(email) -> str:
+    return email.strip().lower() if email else ""
+
+def email_local_part(email: str) -> str:
+    """Local part of a normalized email without a '+tag' suffix."""
+    return email.split("@", 1)[0].split("+", 1)[0]
+
+def key_hash(value: str) -> int:
+    """64-bit key for a string. Only compared within one run (str hashes are per-process)."""
+    return hash(value)
+
+# --- Loading ---
+
+class UserArrays:
+    """Columns needed for matching, as numpy arrays indexed by row (users ordered by ID)."""
+
+    def __init__(self, user_ids, name_keys, birth_ordinals, birth_years, email_rows, emails):
+        self.user_ids = user_ids # int64, sorted
+        self.name_keys = name_keys # int64 hash of normalize_name, 0 if no name
+        self.birth_ordinals = birth_ordinals # int64 date ordinal, 0 if unknown
+        self.birth_years = birth_years # int64, 0 if unknown
+        self.email_rows = email_rows # int64 row owning emails[k]
+        self.emails = emails # list of normalized primary + secondary emails
+
+def load_users(conn) -> UserArrays:
+    """Streams users and secondary emails from the database into UserArrays."""
+    user_ids, name_keys, birth_ordinals, birth_years = [], [], [], []
+    email_rows, emails = [], []
+
+    result = conn.execution_options(yield_per=LOAD_CHUNK_SIZE).execute(
+        select(models.User.id, models.User.full_name, models.User.birth_date, models.User.primary_email)
+        .order_by(models.User.id)
+    )
+    for row_index, (user_id, full_name, birth_date, primary_email) in enumerate(result):
+        user_ids.append(user_id)
+        name = normalize_name(full_name)
+        name_keys.append(key_hash(name) if name else 0)
+        birth_ordinals.append(birth_date.toordinal() if birth_date else 0)
+        birth_years.append(birth_date.year if birth_date else 0)
+        email = normalize_email(primary_email)
+        if email:
+            email_rows.append(row_index)
+            emails.append(email)
+    user_ids = np.array(user_ids, dtype=np.int64)
+
+    secondary_user_ids, secondary_emails = [], []
+    result = conn.execution_options(yield_per=LOAD_CHUNK_SIZE).execute(
+        select(models.SecondaryEmail.user_id, models.SecondaryEmail.email)
+    )
+    for user_id, email in result:
+        email = normalize_email(email)
+        if email and user_id is not None:
+            secondary_user_ids.append(user_id)
+            secondary_emails.append(email)
+    # Map owner IDs to row indexes in one vectorized lookup (dropping orphans)
+    secondary_user_ids = np.array(secondary_user_ids, dtype=np.int64)
+    secondary_rows = np.searchsorted(user_ids, secondary_user_ids)
+    found = secondary_rows < len(user_ids)
+    found[found] &= user_ids[secondary_rows[found]] == secondary_user_ids[found]
+    email_rows.extend(secondary_rows[found].tolist())
+    emails.extend(email for email, ok in zip(secondary_emails, found) if ok)
+
+    return UserArrays(
+        user_ids,
+        np.array(name_keys, dtype=np.int64),
+        np.array(birth_ordinals, dtype=np.int64),
+        np.array(birth_years, dtype=np.int64),
+        np.array(email_rows, dtype=np.int64),
+        emails,
+    )
+
+# --- Blocking ---
+
+def block_pairs(keys: np.ndarray, rows: np.ndarray, max_block_size: int) -> np.ndarray:
+    """
+    All (a, b) row pairs with a < b that share a key, as an (m, 2) array.
+    Blocks are expanded per block size, so no Python loop runs per block.
+    """
+    if len(keys) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    keys, rows = keys[order], rows[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    sizes = np.diff(np.concatenate((starts, [len(keys)])))
+
+    pairs = [np.empty((0, 2), dtype=np.int64)]
+    for size in np.unique(sizes):
+        if size < 2 or size > max_block_size:
+            continue
+        block_starts = starts[sizes == size]
+        first, second = np.triu_indices(size, k=1)
+        a = rows[block_starts[:, None] + first[None, :]].ravel()
+        b = rows[block_starts[:, None] + second[None, :]].ravel()
+        pairs.append(np.stack((np.minimum(a, b), np.maximum(a, b)), axis=1))
+    pairs = np.concatenate(pairs)
+    return pairs[pairs[:, 0] != pairs[:, 1]] # A user listing two emails with the same local part
+
+def encode_pairs(pairs: np.ndarray, n: int) -> np.ndarray:
+    """Unique, sorted int64 codes (a * n + b) for row pairs."""
+    return np.unique(pairs[:, 0] * n + pairs[:, 1])
+
+def candidate_pairs(users: UserArrays, max_block_size: int):
+    """
+    Candidate pair codes, plus the sorted codes of pairs sharing an email local part
+    and of pairs sharing an exact email.
+    """
+    n = len(users.user_ids)
+    rows = np.arange(n, dtype=np.int64)
+
+    # Users without a name or birth date aren't blocked on name + year
+    mask = (users.name_keys != 0) & (users.birth_years != 0)
+    name_year_keys = users.name_keys[mask] * 10007 + users.birth_years[mask]
+    name_year = encode_pairs(block_pairs(name_year_keys, rows[mask], max_block_size), n)
+
+    local_keys = np.array([key_hash(email_local_part(email)) for email in users.emails], dtype=np.int64)
+    exact_keys = np.array([key_hash(email) for email in users.emails], dtype=np.int64)
+    shared_local = encode_pairs(block_pairs(local_keys, users.email_rows, max_block_size), n)
+    shared_exact = encode_pairs(block_pairs(exact_keys, users.email_rows, max_block_size), n)
+
+    candidates = np.union1d(np.union1d(name_year, shared_local), shared_exact)
+    return candidates, shared_local, shared_exact
+
+# --- Scoring (runs in worker processes) ---
+
+_worker_state = {}
+
+def _init_worker(n, name_keys, birth_ordinals, birth_years, shared_local, shared_exact):
+    _worker_state.update(
+        n=n, name_keys=name_keys, birth_ordinals=birth_ordinals, birth_years=birth_years,
+        shared_local=shared_local, shared_exact=shared_exact,
+    )
+
+def _contains(sorted_codes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Vectorized membership test of codes in a sorted array."""
+    if len(sorted_codes) == 0:
+        return np.zeros(len(codes), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_codes, codes), len(sorted_codes) - 1)
+    return sorted_codes[positions] == codes
+
+def score_batch(codes: np.ndarray, threshold: float):
+    """
+    Scores a batch of candidate pair codes.
+    Returns (codes, scores, reason bit flags) of pairs scoring at least `threshold`.
+    Reason bits: 1 name, 2 birth date, 4 birth year, 8 email local part, 16 exact email.
+    """
+    state = _worker_state
+    a, b = np.divmod(codes, state["n"])
+    same_name = (state["name_keys"][a] == state["name_keys"][b]) & (state["name_keys"][a] != 0)
+    same_date = (state["birth_ordinals"][a] == state["birth_ordinals"][b]) & (state["birth_ordinals"][a] != 0)
+    same_year = ~same_date & (state["birth_years"][a] == state["birth_years"][b]) & (state["birth_years"][a] != 0)
+    shared_local = _contains(state["shared_local"], codes)
+    shared_exact = _contains(state["shared_exact"], codes)
+
+    scores = np.minimum(
+        WEIGHT_SAME_NAME * same_name
+        + WEIGHT_SAME_BIRTH_DATE * same_date
+        + WEIGHT_SAME_BIRTH_YEAR * same_year
+        + WEIGHT_SHARED_EMAIL_LOCAL * shared_local
+        + WEIGHT_SHARED_EMAIL * shared_exact,
+        1.0,
+    )
+    reasons = (same_name * 1) | (same_date * 2) | (same_year * 4) | (shared_local * 8) | (shared_exact * 16)
+    matched = scores >= threshold
+    return codes[matched], scores[matched], reasons[matched]
+
+REASON_NAMES = {1: "name", 2: "birth_date", 4: "birth_year", 8: "email_local_part", 16: "email"}
+
+def describe_reasons(flags: int) -> str:
+    return ",".join(name for bit, name in REASON_NAMES.items() if flags & bit)
+
+def score_pairs(users: UserArrays, candidates, shared_local, shared_exact, threshold: float, workers: int):
+    """Scores all candidate pairs in batches; returns matched (codes, scores, reasons)."""
+    init_args = (
+        len(users.user_ids), users.name_keys, users.birth_ordinals, users.birth_years, shared_local, shared_exact,
+    )
+    batches = [candidates[i:i + BATCH_SIZE] for i in range(0, len(candidates), BATCH_SIZE)]
+    if workers <= 1 or len(batches) <= 1:
+        _init_worker(*init_args)
+        results = [score_batch(batch, threshold) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.map(score_batch, batches, [threshold] * len(batches)))
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64)
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+# --- Clustering ---
+
+def cluster_matches(n: int, codes: np.ndarray, scores: np.ndarray, reasons: np.ndarray) -> list:
+    """
+    Groups matched pairs into connected components.
+    Returns a list of clusters, each a dict row -> (best score, reasons of that best pair).
+    """
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root: # Path compression
+            parent[x], x = root, parent[x]
+        return root
+
+    a_rows, b_rows = np.divmod(codes, n)
+    for a, b in zip(a_rows.tolist(), b_rows.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = {}
+    for a, b, score, flags in zip(a_rows.tolist(), b_rows.tolist(), scores.tolist(), reasons.tolist()):
+        members = clusters.setdefault(find(a), {})
+        for row in (a, b):
+            if row not in members or score > members[row][0]:
+                members[row] = (score, describe_reasons(flags))
+    return list(clusters.values())
+
+# --- Writing ---
+
+def write_clusters(users: UserArrays, clusters: list, run_id: str) -> int:
+    """
+    Replaces pending clusters from earlier runs with this run's clusters, skipping clusters
+    whose members were already reviewed as a group. Returns the number of clusters written.
+    """
+    db = SessionLocal()
+    try:
+        pending_ids = select(models.DuplicateCluster.id).where(models.DuplicateCluster.status == "pending")
+        db.execute(delete(models.DuplicateClusterMember).where(models.DuplicateClusterMember.cluster_id.in_(pending_ids)))
+        db.execute(delete(models.DuplicateCluster).where(models.DuplicateCluster.status == "pending"))
+
+        reviewed = {}
+        for cluster_id, user_id in db.execute(select(models.DuplicateClusterMember.cluster_id, models.DuplicateClusterMember.user_id)):
+            reviewed.setdefault(cluster_id, set()).add(user_id)
+        reviewed = {frozenset(user_ids) for user_ids in reviewed.values()}
+        clusters = [
+            members for members in clusters
+            if frozenset(int(users.user_ids[row]) for row in members) not in reviewed
+        ]
+
+        for start in range(0, len(clusters), INSERT_CHUNK_SIZE):
+            chunk = clusters[start:start + INSERT_CHUNK_SIZE]
+            db_clusters = [
+                models.DuplicateCluster(
+                    run_id=run_id,
+                    size=len(members),
+                    max_score=max(score for score, _ in members.values()),
+                    status="pending",
+                )
+                for members in chunk
+            ]
+            db.add_all(db_clusters)
+            db.flush() # Assigns cluster IDs
+            member_rows = [
+                {
+                    "cluster_id": db_cluster.id,
+                    "user_id": int(users.user_ids[row]),
+                    "score": round(score, 4),
+                    "reasons": reasons,
+                }
+                for db_cluster, members in zip(db_clusters, chunk)
+                for row, (score, reasons) in members.items()
+            ]
+            db.execute(insert(models.DuplicateClusterMember), member_rows)
+        db.commit()
+        return len(clusters)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# --- Entry Point ---
+
+def run(threshold: float = DEFAULT_THRESHOLD, workers: int = None, max_block_size: int = DEFAULT_MAX_BLOCK_SIZE, dry_run: bool = False) -> dict:
+    """Runs the whole job and returns summary stats."""
+    workers = workers or os.cpu_count() or 1
+    run_id = uuid.uuid4().hex
+    timings = {}
+
+    started = time.monotonic()
+    with get_engine().connect() as conn:
+        users = load_users(conn)
+    timings["load_s"] = round(time.monotonic() - started, 2)
+
+    started = time.monotonic()
+    candidates, shared_local, shared_exact = candidate_pairs(users, max_block_size)
+    timings["blocking_s"] = round(time.monotonic() - started, 2)
+
+    started = time.monotonic()
+    codes, scores, reasons = score_pairs(users, candidates, shared_local, shared_exact, threshold, workers)
+    clusters = cluster_matches(len(users.user_ids), codes, scores, reasons)
+    timings["scoring_s"] = round(time.monotonic() - started, 2)
+
+    if not dry_run:
+        started = time.monotonic()
+        written = write_clusters(users, clusters, run_id)
+        timings["write_s"] = round(time.monotonic() - started, 2)
+
+    return {
+        "run_id": run_id,
+        "users": len(users.user_ids),
+        "candidate_pairs": len(candidates),
+        "matched_pairs": len(codes),
+        "clusters": len(clusters),
+        "clusters_written": 0 if dry_run else written,
+        "dry_run": dry_run,
+        **timings,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect probable duplicate users and write review clusters.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimum pair score (0-1) to count as a match")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: CPU count)")
+    parser.add_argument("--max-block-size", type=int, default=DEFAULT_MAX_BLOCK_SIZE, help="Skip blocking keys shared by more users than this")
+    parser.add_argument("--dry-run", action="store_true", help="Compute clusters without writing them")
+    args = parser.parse_args()
+
+    bootstrap_schema() # Make sure the cluster tables exist
+    summary = run(args.threshold, args.workers, args.max_block_size, args.dry_run)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,13 @@ import io
 import csv
 import codecs # Needed for reading UploadFile content as text
 from fastapi import FastAPI, Depends, HTTPException, Query, status, UploadFile, File
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-import crud, models, schemas, database # Changed from relative import
-from database import SessionLocal, engine, async_create_db_and_tables, connect_db, disconnect_db # Import the new async function
+import crud, models, schemas, database, admin, admission, search_cache, profiling # Changed from relative import
+from database import async_create_db_and_tables, dispose_engines, check_db # Import the new async function
+from database import get_db, get_read_db # get_db -> primary (writes), get_read_db -> replica when configured
 
 # Load environment variables from .env file
 # This should be one of the first things your application does.
@@ -21,24 +22,34 @@ load_dotenv()
 # create_db_and_tables() # DO NOT CALL HERE AT MODULE LEVEL
 
 app = FastAPI(title="User Info API", description="API for managing user information and emails.")
+# Routes are created with ProfiledRoute so opt-in profiling can follow sync endpoints into the threadpool
+app.router.route_class = profiling.ProfiledRoute
 
 # --- Event Handlers ---
 
 @app.on_event("startup")
 async def startup_event():
-    """Connect to database on startup."""
-    await connect_db()
+    """Create tables on startup, unless a launcher (serve.py) already did it once for all workers."""
+    if os.getenv("DB_BOOTSTRAP_ON_STARTUP", "1") != "1":
+        return
     # Create tables if they don't exist (safe to call multiple times)
-    # This ensures tables are created after the DB connection is established
-    # and within the async context.
+    # This runs within the async context, as required by async drivers.
     print("Creating database tables if they don't exist...")
     await async_create_db_and_tables() # Call the async version
     print("Database tables checked/created.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Disconnect from database on shutdown."""
-    await disconnect_db()
+    """Close pooled database connections on shutdown."""
+    dispose_engines()
+
+# --- Middleware (Read-your-writes) ---
+# Issues the last_write token that keeps a client's reads on the primary after it writes (see database.py)
+app.add_middleware(database.ReadYourWritesMiddleware)
+
+# --- Middleware (Profiling) ---
+# Only installed when ADMIN_TOKEN or PROFILE_SAMPLE_RATE is set (see profiling.py)
+profiling.install(app)
 
 # --- Middleware (Example: CORS) ---
 from fastapi.middleware.cors import CORSMiddleware
@@ -67,13 +78,8 @@ app.add_middleware(
 
 
 # --- Dependency ---
-def get_db():
-    """Dependency to get a database session for each request."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# get_db and get_read_db are defined in database.py. Read-only endpoints use get_read_db so
+# that, when REPLICA_DATABASE_URLS is set, they are served by a read replica.
 
 # --- API Endpoints ---
 
@@ -91,15 +97,15 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Check secondary emails for uniqueness across all users if needed (more complex query)
     return crud.create_user(db=db, user=user)
 
-@app.get("/api/users/", response_model=List[schemas.User], tags=["Users"])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@app.get("/api/users/", response_model=List[schemas.User], tags=["Users"], dependencies=[Depends(admission.limit("search"))])
+def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """
     Retrieve a list of users with pagination.
     """
     users = crud.get_users(db, skip=skip, limit=limit)
     return users
 
-@app.get("/api/users/search/", response_model=List[schemas.User], tags=["Users"])
+@app.get("/api/users/search/", response_model=List[schemas.User], tags=["Users"], dependencies=[Depends(admission.limit("search"))])
 def search_users_endpoint(
     full_name: Optional[str] = Query(None, description="Search by partial full name (case-insensitive)"),
     # university: Optional[str] = Query(None, description="Search by partial university name (case-insensitive)"), # Removed
@@ -111,7 +117,7 @@ def search_users_endpoint(
     high_school: Optional[str] = Query(None, description="Search by partial high school name (case-insensitive)"),
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Search for users based on various criteria. All criteria are optional and combined with AND.
@@ -131,8 +137,8 @@ def search_users_endpoint(
     return users
 
 
-@app.get("/api/users/{user_id}", response_model=schemas.User, tags=["Users"])
-def read_user(user_id: int, db: Session = Depends(get_db)):
+@app.get("/api/users/{user_id}", response_model=schemas.User, tags=["Users"], dependencies=[Depends(admission.limit("point_read"))])
+def read_user(user_id: int, db: Session = Depends(get_read_db)):
     """
     Retrieve a single user by their ID.
     """
@@ -170,8 +176,8 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 
 # --- Data Export ---
 
-@app.get("/api/users/export/csv", tags=["Data Export"])
-def export_users_to_csv(db: Session = Depends(get_db)):
+@app.get("/api/users/export/csv", tags=["Data Export"], dependencies=[Depends(admission.limit("export"))])
+def export_users_to_csv(db: Session = Depends(get_read_db)):
     """
     Export all user data (including secondary emails and educations) to a CSV file.
     """
@@ -233,10 +239,11 @@ def export_users_to_csv(db: Session = Depends(get_db)):
 
 # --- Data Import ---
 
-@app.post("/api/users/import/csv", tags=["Data Import"])
-async def import_users_from_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+@app.post("/api/users/import/csv", tags=["Data Import"], dependencies=[Depends(admission.limit("import"))])
+def import_users_from_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """
     Import users from a CSV file.
+    Sync endpoint: the file read and per-row DB work run in the threadpool, not on the event loop.
     Assumes CSV header matches the UserCreate schema fields (or a subset).
     Skips users if primary_email already exists.
     Required columns: primary_email, full_name. Others are optional.
@@ -249,7 +256,7 @@ async def import_users_from_csv(file: UploadFile = File(...), db: Session = Depe
     errors = []
 
     try:
-        # Read the file content asynchronously and decode it
+        # Read the uploaded (spooled) file synchronously and decode it
         # Use codecs.iterdecode for robust handling of streaming data
         content_stream = codecs.iterdecode(file.file, 'utf-8')
         csv_reader = csv.DictReader(content_stream)
@@ -314,7 +321,7 @@ async def import_users_from_csv(file: UploadFile = File(...), db: Session = Depe
         # Catch errors during file reading or initial CSV parsing
         raise HTTPException(status_code=500, detail=f"Error processing CSV file: {str(e)}")
     finally:
-        await file.close() # Ensure the file is closed
+        file.file.close() # Ensure the file is closed
 
     return JSONResponse(
         status_code=200,
@@ -384,6 +391,92 @@ def delete_education(education_id: int, db: Session = Depends(get_db)):
 #     return crud.get_educations_by_user(db=db, user_id=user_id)
 
 
+# -- Duplicate Review --
+# Clusters are produced by the batch job: `python dedup.py` (see dedup.py)
+
+@app.get("/api/duplicates/", response_model=List[schemas.DuplicateCluster], tags=["Duplicates"])
+def read_duplicate_clusters(status: Optional[str] = "pending", skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    """
+    List probable duplicate-user clusters for review, highest score first.
+    Filter by status ('pending', 'confirmed', 'rejected'); pass an empty status for all.
+    """
+    return crud.get_duplicate_clusters(db, status=status or None, skip=skip, limit=limit)
+
+@app.patch("/api/duplicates/{cluster_id}", response_model=schemas.DuplicateCluster, tags=["Duplicates"])
+def update_duplicate_cluster(cluster_id: int, cluster_update: schemas.DuplicateClusterUpdate, db: Session = Depends(get_db)):
+    """
+    Record the review outcome of a duplicate cluster. Reviewed clusters are kept when dedup.py runs again.
+    """
+    db_cluster = crud.update_duplicate_cluster_status(db, cluster_id=cluster_id, status=cluster_update.status)
+    if db_cluster is None:
+        raise HTTPException(status_code=404, detail="Duplicate cluster not found")
+    return db_cluster
+
+
+# --- Admin / Diagnostics ---
+
+@app.get("/api/admin/admission", tags=["Admin"], dependencies=[Depends(admin.require_admin)])
+async def read_admission_stats():
+    """
+    Admission control stats per cost class (export, import, search, point_read) for this worker:
+    active/queued requests, queue wait times and how many requests were shed with 503.
+    """
+    return admission.get_stats()
+
+@app.get("/api/admin/search-cache", tags=["Admin"], dependencies=[Depends(admin.require_admin)])
+async def read_search_cache_stats():
+    """Search result cache size, evictions and hit/miss counts per query shape (this worker)."""
+    return search_cache.search_cache.stats()
+
+@app.get("/api/admin/profiles", tags=["Admin"], dependencies=[Depends(admin.require_admin)])
+def list_profiles(limit: int = 50):
+    """
+    List captured request profiles (newest first) with route, parameters, duration and SQL totals.
+    Requires the X-Admin-Token header. Profile a request by sending `X-Profile: 1` with the token.
+    """
+    profiles = []
+    for profile_id in profiling.list_profile_ids()[:limit]:
+        profile = profiling.load_profile(profile_id)
+        if profile:
+            profile.pop("sql", None) # Keep the listing small; full SQL timings are in the detail view
+            profiles.append(profile)
+    return profiles
+
+@app.get("/api/admin/profiles/{profile_id}", tags=["Admin"], dependencies=[Depends(admin.require_admin)])
+def read_profile(profile_id: str):
+    """Retrieve a profile's metadata including per-statement SQL timings."""
+    profile = profiling.load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@app.get("/api/admin/profiles/{profile_id}/folded", tags=["Admin"], dependencies=[Depends(admin.require_admin)])
+def download_profile_stacks(profile_id: str):
+    """
+    Download a profile's sampled stacks in folded format
+    (render with flamegraph.pl or load into https://www.speedscope.app).
+    """
+    path = profiling.profile_path(profile_id, "folded")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
+
+# --- Health Checks ---
+
+@app.get("/healthz", tags=["Health"])
+async def liveness():
+    """Liveness probe: the worker is up and serving requests (no database access)."""
+    return {"status": "ok"}
+
+@app.get("/readyz", tags=["Health"])
+def readiness():
+    """Readiness probe: the primary database is reachable."""
+    if not check_db():
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unavailable"})
+    return {"status": "ok"}
+
+
 # --- Root Endpoint ---
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, ForeignKey, Text, func
 from sqlalchemy.orm import relationship
 from database import Base # Changed from relative import
 
@@ -44,4 +44,36 @@ class Education(Base):
     # Optional: Add start_date, end_date, degree, etc.
 
     # Relationship back to the user
-    user = relationship("User", back_populates="educations")
\ No newline at end of file
+    user = relationship("User", back_populates="educations")
+
+# Change counters used to invalidate caches (e.g. the search result cache)
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True) # Logical table/group name, e.g. 'users'
+    version = Column(Integer, nullable=False, default=0) # Bumped by every write in crud.py
+
+
+# Probable duplicate users found by the batch job in dedup.py, for manual review
+class DuplicateCluster(Base):
+    __tablename__ = "duplicate_clusters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String, index=True) # dedup.py run that produced the cluster
+    size = Column(Integer, nullable=False) # Number of users in the cluster
+    max_score = Column(Float, nullable=False) # Highest pair score in the cluster (0-1)
+    status = Column(String, nullable=False, default="pending", index=True) # 'pending', 'confirmed' or 'rejected'
+    created_at = Column(DateTime, server_default=func.now())
+
+    members = relationship("DuplicateClusterMember", back_populates="cluster", cascade="all, delete-orphan")
+
+class DuplicateClusterMember(Base):
+    __tablename__ = "duplicate_cluster_members"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cluster_id = Column(Integer, ForeignKey("duplicate_clusters.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True) # Removed by crud.delete_user before the user
+    score = Column(Float, nullable=False) # Best score of a match involving this user
+    reasons = Column(String, nullable=True) # e.g. 'name,birth_date,email_local_part'
+
+    cluster = relationship("DuplicateCluster", back_populates="members")
@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import Counter
+from typing import Optional
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from admin import ADMIN_TOKEN, token_matches
+
+# --- Opt-in Per-Request Profiling ---
+# A request is profiled when it carries `X-Profile: 1` plus a valid `X-Admin-Token`
+# (ADMIN_TOKEN env var, see admin.py), or when it is picked by PROFILE_SAMPLE_RATE (0.0 - 1.0).
+# While it runs, a sampler thread records the stacks of every thread while it does work for
+# it (the event loop while the request's task is the one running, the threadpool thread running
+# the endpoint, and any thread while it runs the request's SQL, e.g. lazy relationship loads
+# during response_model validation) and SQL timings.
+# Each profile is written to PROFILE_DIR as JSON metadata + folded stacks (the input format
+# of flamegraph.pl / speedscope), and can be listed/downloaded via /api/admin/profiles.
+#
+# With neither ADMIN_TOKEN nor PROFILE_SAMPLE_RATE set, nothing is installed (zero overhead);
+# otherwise unprofiled requests cost one header check / random() and a context-var lookup.
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "100"))
+
+ENABLED = bool(ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+class RequestProfile:
+    """Samples the registered threads of one request and collects its SQL timings."""
+
+    def __init__(self, method: str, path: str, query_string: str, reason: str):
+        self.started_at = time.time()
+        # Sortable by start time: YYYYmmdd-HHMMSSmmm-<random>
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}{int(self.started_at * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.reason = reason # 'header' or 'sampled'
+        self.route = None
+        self.path_params = {}
+        self.status_code = None
+        self.duration_ms = None
+        self.stacks = Counter() # folded stack -> sample count
+        self.sql = [] # [{"statement": ..., "duration_ms": ...}]
+        self._threads = Counter() # thread id -> nesting depth of register_thread calls
+        self._loop = None # Event loop running the request, see watch_task
+        self._loop_thread = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+
+    def register_thread(self, thread_id: Optional[int] = None):
+        """Sample this thread until the matching unregister_thread call (calls may nest)."""
+        with self._lock:
+            self._threads[thread_id or threading.get_ident()] += 1
+
+    def unregister_thread(self, thread_id: Optional[int] = None):
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] -= 1
+            if self._threads[thread_id] <= 0:
+                del self._threads[thread_id]
+
+    def watch_task(self, task: asyncio.Task):
+        """
+        Sample the event loop thread, but only while `task` is the task it is running: the loop
+        is shared by every in-flight request, so other requests' coroutines must not be counted.
+        """
+        self._loop = task.get_loop()
+        self._loop_thread = threading.get_ident()
+        self._task = task
+
+    def _is_sampled(self, thread_id: int) -> bool:
+        if thread_id == self._loop_thread:
+            return asyncio.current_task(self._loop) is self._task
+        return thread_id in self._threads
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.duration_ms = round((time.time() - self.started_at) * 1000, 2)
+
+    def _sample_loop(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = [thread_id for thread_id in frames if self._is_sampled(thread_id)]
+            for thread_id in thread_ids:
+                frame = frames[thread_id]
+                # Skip the event loop sitting idle in select() (waiting on IO or the threadpool)
+                if not frame.f_code.co_filename.endswith("selectors.py"):
+                    self.stacks[_fold(frame)] += 1
+
+    def add_sql(self, statement: str, duration: float):
+        with self._lock:
+            self.sql.append({"statement": statement, "duration_ms": round(duration * 1000, 3)})
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "path_params": self.path_params,
+            "query_string": self.query_string,
+            "reason": self.reason,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": sum(self.stacks.values()),
+            "sample_interval_ms": PROFILE_INTERVAL_MS,
+            "sql_count": len(self.sql),
+            "sql_total_ms": round(sum(q["duration_ms"] for q in self.sql), 3),
+        }
+
+    def save(self):
+        """Writes <id>.json (summary + SQL timings) and <id>.folded (stacks) to PROFILE_DIR."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), "w") as f:
+            json.dump({**self.summary(), "sql": self.sql}, f, default=str)
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.folded"), "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune()
+
+def _fold(frame) -> str:
+    """Folded stack (root first, ';'-separated) for a frame."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def _prune():
+    """Keep only the newest PROFILE_MAX_STORED profiles."""
+    ids = list_profile_ids()
+    for profile_id in ids[PROFILE_MAX_STORED:]:
+        for ext in ("json", "folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{profile_id}.{ext}"))
+            except FileNotFoundError:
+                pass
+
+# --- Hooks ---
+
+class ProfilingMiddleware:
+    """ASGI middleware deciding which requests to profile. Only installed when ENABLED."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        reason = _should_profile(scope)
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(
+            scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"), reason
+        )
+        profile.watch_task(asyncio.current_task()) # Event loop thread (async endpoints, middleware, routing)
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            profile.stop()
+            route = scope.get("route")
+            profile.route = getattr(route, "path", None)
+            profile.path_params = scope.get("path_params", {})
+            # Don't block the event loop on file IO
+            await asyncio.get_running_loop().run_in_executor(None, profile.save)
+
+def _should_profile(scope) -> Optional[str]:
+    if ADMIN_TOKEN:
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") == b"1" and token_matches(headers.get(b"x-admin-token")):
+            return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+class ProfiledRoute(APIRoute):
+    """
+    Route class that registers the thread running the endpoint with the active profile
+    (sync endpoints run in a threadpool thread the middleware can't see).
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if ENABLED and not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _register_thread_wrapper(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def _register_thread_wrapper(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        profile.register_thread()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.unregister_thread()
+    return wrapper
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is not None:
+        # Also picks up threads doing lazy loads while validating the response_model; they are
+        # sampled only while the statement runs, since the thread then returns to the pool
+        profile.register_thread()
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    starts = conn.info.get("profile_query_start")
+    if profile is not None and starts:
+        profile.add_sql(statement, time.perf_counter() - starts.pop())
+        profile.unregister_thread()
+
+def _handle_error(exception_context):
+    # after_cursor_execute doesn't run for failed statements
+    profile = _current_profile.get()
+    conn = exception_context.connection
+    starts = conn.info.get("profile_query_start") if conn is not None else None
+    if profile is not None and starts:
+        starts.pop()
+        profile.unregister_thread()
+
+def install(app):
+    """Installs the profiling middleware and SQL timing hooks if profiling is configured."""
+    if not ENABLED:
+        return
+    app.add_middleware(ProfilingMiddleware)
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    print(f"Request profiling enabled (sample rate: {PROFILE_SAMPLE_RATE}, header trigger: {bool(ADMIN_TOKEN)})")
+
+# --- Storage / Admin ---
+
+def list_profile_ids() -> list:
+    """Stored profile IDs, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = [name[:-len(".json")] for name in os.listdir(PROFILE_DIR) if name.endswith(".json")]
+    return sorted(ids, reverse=True)
+
+def profile_path(profile_id: str, ext: str) -> Optional[str]:
+    """Path of a stored profile file, or None if it doesn't exist (IDs are validated against the listing)."""
+    if profile_id not in list_profile_ids():
+        return None
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{ext}")
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    path = profile_path(profile_id, "json")
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
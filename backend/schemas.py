@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, field_validator, Field
-from typing import List, Optional
-from datetime import date
+from typing import List, Literal, Optional
+from datetime import date, datetime
 
 # --- Secondary Email Schemas ---
 
@@ -88,4 +88,29 @@ class UserSearchQuery(BaseModel):
     primary_email: Optional[EmailStr] = None
     secondary_email: Optional[EmailStr] = None # Search by secondary email
     high_school: Optional[str] = None
-    # Add other searchable fields as needed
\ No newline at end of file
+    # Add other searchable fields as needed
+
+# --- Duplicate Detection Schemas ---
+
+class DuplicateClusterMember(BaseModel):
+    user_id: int
+    score: float
+    reasons: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class DuplicateCluster(BaseModel):
+    id: int
+    run_id: str
+    size: int
+    max_score: float
+    status: str
+    created_at: Optional[datetime] = None
+    members: List[DuplicateClusterMember] = []
+
+    class Config:
+        from_attributes = True
+
+class DuplicateClusterUpdate(BaseModel):
+    status: Literal["pending", "confirmed", "rejected"]
@@ -0,0 +1,88 @@
+import os
+import threading
+from collections import OrderedDict
+
+# --- Search Result Cache ---
+# Caches the ordered list of matching user ids for a (normalized search query, skip, limit).
+# Each entry remembers the 'users' table version it was computed at; every write in crud.py
+# bumps that version (see crud.bump_users_version), so stale entries are never served.
+# A cached page then costs a version lookup plus one `id IN (...)` fetch instead of the
+# ilike/join scan in crud.search_users.
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024")) # Max entries (LRU); 0 disables
+
+SEARCH_FIELDS = (
+    "full_name", "institution_name", "institution_type",
+    "primary_email", "secondary_email", "high_school",
+)
+
+def normalize_query(query) -> tuple:
+    """
+    Normalized, hashable form of a UserSearchQuery.
+    Empty filters are dropped (search_users ignores them). Values are kept as-is: how ilike
+    folds case depends on the database (ASCII-only on SQLite, locale-dependent on PostgreSQL),
+    so folding them here could make queries with different results share an entry.
+    """
+    items = []
+    for field in SEARCH_FIELDS:
+        value = getattr(query, field, None)
+        if value:
+            items.append((field, str(value)))
+    return tuple(items)
+
+def query_shape(normalized: tuple) -> str:
+    """Which filters a query uses, e.g. 'full_name+institution_name' (for hit statistics)."""
+    return "+".join(field for field, _ in normalized) or "(none)"
+
+class SearchCache:
+    """Thread-safe, size-bounded LRU of search result id lists with per-shape stats."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict() # key -> (version, [user ids])
+        self._stats = {} # query shape -> {"hits": n, "misses": n}
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, shape: str, outcome: str):
+        shape_stats = self._stats.setdefault(shape, {"hits": 0, "misses": 0})
+        shape_stats[outcome] += 1
+
+    def get(self, key: tuple, version: int):
+        """Cached ids for `key` if computed at `version`, else None."""
+        shape = query_shape(key[0])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self._entries[key] # Stale: table changed since it was cached
+                self._count(shape, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count(shape, "hits")
+            return entry[1]
+
+    def put(self, key: tuple, version: int, ids: list):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, list(ids))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "evictions": self.evictions,
+                "by_query_shape": {shape: dict(counts) for shape, counts in self._stats.items()},
+            }
+
+search_cache = SearchCache(SEARCH_CACHE_SIZE)
@@ -0,0 +1,51 @@
+"""
+Production launcher.
+
+Bootstraps the database schema once (create missing tables, seed change versions), then
+starts N uvicorn worker processes that skip the per-worker startup DDL. Engines are created
+lazily inside each worker (see database.get_engine), and the launcher disposes its own
+before the workers start, so no pooled connections are shared across processes.
+
+Usage (from the backend directory):
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8001] [--skip-bootstrap]
+    python serve.py --bootstrap-only   # Only create the schema (e.g. before starting workers another way)
+
+Defaults come from WEB_CONCURRENCY (workers, else CPU count) and BACKEND_PORT (port).
+Probes: GET /healthz (liveness) and GET /readyz (readiness, checks the database).
+"""
+import os
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv() # Before importing database so DATABASE_URL from .env is used; workers inherit the environment
+
+import uvicorn # noqa: E402
+import models # noqa: E402 (registers the tables on Base)
+import database # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the User Info API with multiple workers.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--host", default=os.getenv("BACKEND_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("BACKEND_PORT", "8001")))
+    parser.add_argument("--skip-bootstrap", action="store_true", help="Don't create tables (schema managed elsewhere)")
+    parser.add_argument("--bootstrap-only", action="store_true", help="Create tables and exit without starting workers")
+    args = parser.parse_args()
+    if args.skip_bootstrap and args.bootstrap_only:
+        parser.error("--skip-bootstrap and --bootstrap-only are mutually exclusive")
+
+    if not args.skip_bootstrap:
+        print("Bootstrapping database schema...")
+        database.bootstrap_schema()
+        print("Database schema ready.")
+    database.dispose_engines() # Don't carry the launcher's connections into the workers
+    if args.bootstrap_only:
+        return
+    os.environ["DB_BOOTSTRAP_ON_STARTUP"] = "0" # Workers skip startup_event's table creation
+
+    print(f"Starting {args.workers} worker(s) on {args.host}:{args.port}")
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, proxy_headers=True)
+
+if __name__ == "__main__":
+    main()
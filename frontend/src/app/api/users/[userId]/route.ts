@@ -1,4 +1,5 @@
 import { NextResponse, NextRequest } from 'next/server';
+import { lastWriteHeaders, relayLastWrite } from '@/lib/readYourWrites';
 
 // Define params type
 type RouteParams = { userId: string };
@@ -20,7 +21,7 @@ export async function GET(
     try {
         const res = await fetch(`${backendUrl}/api/users/${userId}`, {
             method: 'GET',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', ...lastWriteHeaders(request) },
             cache: 'no-store',
         });
 
@@ -68,7 +69,7 @@ export async function PUT(
         }
 
         const data = await res.json();
-        return NextResponse.json(data);
+        return relayLastWrite(res, NextResponse.json(data));
 
     } catch (error) {
         console.error(`Error updating user ${userId} via backend API:`, error);
@@ -103,11 +104,11 @@ export async function DELETE(
 
         // Handle potential empty response body for DELETE
         if (res.status === 204 || res.headers.get('content-length') === '0') {
-            return new Response(null, { status: 204 }); // No Content
+            return relayLastWrite(res, new Response(null, { status: 204 })); // No Content
         }
 
         const data = await res.json();
-        return NextResponse.json(data); // Or return status 204 if backend confirms deletion without body
+        return relayLastWrite(res, NextResponse.json(data)); // Or return status 204 if backend confirms deletion without body
 
     } catch (error) {
         console.error(`Error deleting user ${userId} via backend API:`, error);
@@ -1,8 +1,9 @@
-import { NextResponse } from 'next/server';
+import { NextResponse, NextRequest } from 'next/server';
+import { lastWriteHeaders } from '@/lib/readYourWrites';
 
 const backendUrl = process.env.NEXT_PUBLIC_API_BASE_URL;
 
-export async function GET() { // Remove unused request parameter
+export async function GET(request: NextRequest) {
     if (!backendUrl) {
         return NextResponse.json({ error: 'Backend API URL not configured' }, { status: 500 });
     }
@@ -13,6 +14,7 @@ export async function GET() { // Remove unused request parameter
             headers: {
                 // Forward necessary headers if needed
                 'Accept': 'text/csv', // Indicate we expect CSV
+                ...lastWriteHeaders(request), // Export this user's recent writes from the primary
             },
             cache: 'no-store',
         });
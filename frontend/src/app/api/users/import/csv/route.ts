@@ -1,4 +1,5 @@
 import { NextResponse } from 'next/server';
+import { relayLastWrite } from '@/lib/readYourWrites';
 
 const backendUrl = process.env.NEXT_PUBLIC_API_BASE_URL;
 
@@ -23,7 +24,7 @@ export async function POST(request: Request) {
         const data = await res.json();
 
         // Return the response from the backend (including status code and JSON body)
-        return NextResponse.json(data, { status: res.status });
+        return relayLastWrite(res, NextResponse.json(data, { status: res.status }));
 
     } catch (error) {
         console.error('Error posting import CSV to backend API:', error);
@@ -1,9 +1,10 @@
-import { NextResponse } from 'next/server';
+import { NextResponse, NextRequest } from 'next/server';
+import { lastWriteHeaders, relayLastWrite } from '@/lib/readYourWrites';
 
 // Ensure the backend URL is available server-side
 const backendUrl = process.env.NEXT_PUBLIC_API_BASE_URL;
 
-export async function GET(request: Request) {
+export async function GET(request: NextRequest) {
     // Extract search params from the incoming request (e.g., for skip, limit, search)
     const { searchParams } = new URL(request.url);
 
@@ -18,6 +19,7 @@ export async function GET(request: Request) {
             headers: {
                 // Forward necessary headers if needed, be careful with sensitive ones
                 'Content-Type': 'application/json',
+                ...lastWriteHeaders(request), // Read this user's recent writes from the primary
             },
             // Important for server-to-server requests within Docker network
             cache: 'no-store',
@@ -67,7 +69,7 @@ export async function POST(request: Request) {
         }
 
         const data = await res.json();
-        return NextResponse.json(data, { status: res.status }); // Forward status code (e.g., 201 Created)
+        return relayLastWrite(res, NextResponse.json(data, { status: res.status })); // Forward status code (e.g., 201 Created)
 
     } catch (error) {
         console.error('Error posting to backend API:', error);
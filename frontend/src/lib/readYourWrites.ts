@@ -0,0 +1,24 @@
+import { NextRequest } from 'next/server';
+
+// Read-your-writes with backend read replicas (see backend/database.py):
+// the backend answers writes with a signed `last_write` token (Set-Cookie + X-Last-Write header)
+// and serves reads that present a fresh token from the primary database.
+// These route handlers call the backend server-side, so the token has to be passed through
+// explicitly, per user: the backend's Set-Cookie is relayed to the browser, and the browser's
+// cookie is sent back to the backend as X-Last-Write on reads.
+
+export const LAST_WRITE_COOKIE = 'last_write';
+
+// Headers to add to a backend read request for this user
+export function lastWriteHeaders(request: NextRequest): Record<string, string> {
+    const token = request.cookies.get(LAST_WRITE_COOKIE)?.value;
+    return token ? { 'X-Last-Write': token } : {};
+}
+
+// Copies the backend's Set-Cookie headers (the last_write token) onto the response sent to the browser
+export function relayLastWrite<T extends Response>(backendResponse: Response, response: T): T {
+    for (const cookie of backendResponse.headers.getSetCookie()) {
+        response.headers.append('Set-Cookie', cookie);
+    }
+    return response;
+}